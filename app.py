@@ -1,5 +1,6 @@
 from datetime import date
 from pathlib import Path
+from typing import Dict, Optional
 import streamlit as st
 
 from ofz_core import (
@@ -7,6 +8,7 @@ from ofz_core import (
     download_fixed_ofz_cache,
     find_min_qty_for_target,
     fmt_rub,
+    format_log,
     get_bond_cached,
     simulate_reinvest_detailed,
 )
@@ -22,15 +24,38 @@ def format_percent(value: float) -> str:
     return f"{value:.2f} %"
 
 
+def _cache_mtime() -> float:
+    return CACHE_PATH.stat().st_mtime if CACHE_PATH.exists() else 0.0
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_get_bond(secid: str, cache_mtime: float) -> Dict:
+    """Bond из локального кэша между перерисовками; cache_mtime сбрасывает запись после обновления кэша."""
+    return get_bond_cached(secid, CACHE_PATH, use_cache=True)
+
+
+def _get_bond(secid: str, use_cache: bool) -> Dict:
+    # Без локального кэша котировки идут напрямую из MOEX: ofz_core держит их
+    # в памяти не дольше MARKET_TTL, часовой st.cache_data здесь не нужен.
+    if use_cache:
+        return _cached_get_bond(secid, _cache_mtime())
+    return get_bond_cached(secid, CACHE_PATH, use_cache=False)
+
+
+@st.cache_data(show_spinner=False)
+def _cached_cache_info(cache_mtime: float) -> Optional[str]:
+    return cache_info(CACHE_PATH)
+
+
 def sidebar_cache_controls() -> bool:
     st.sidebar.header("Кэш котировок ОФЗ")
     use_cache = st.sidebar.checkbox("Использовать локальный кэш", True)
-    info = cache_info(CACHE_PATH)
+    info = _cached_cache_info(_cache_mtime())
     st.sidebar.caption(f"Кэш: {info or 'нет'}")
 
     if st.sidebar.button("Скачать/обновить кэш"):
         with st.spinner("Скачиваем данные по ОФЗ..."):
-            bonds = download_fixed_ofz_cache(CACHE_PATH)
+            bonds = download_fixed_ofz_cache(CACHE_PATH, use_disk_cache=use_cache)
         st.sidebar.success(f"Сохранено {len(bonds)} бумаг в {CACHE_PATH}")
     return use_cache
 
@@ -48,7 +73,7 @@ def section_income(use_cache: bool) -> None:
             st.error("Укажите SECID.")
             return
         try:
-            bond = get_bond_cached(secid, CACHE_PATH, use_cache=use_cache)
+            bond = _get_bond(secid, use_cache)
             result = simulate_reinvest_detailed(
                 bond=bond,
                 purchase_date=purchase_date,
@@ -68,7 +93,7 @@ def section_income(use_cache: bool) -> None:
         st.metric("Среднегодовая доходность", format_percent(result["annualized_return"]))
 
         with st.expander("Детальный лог реинвестирования"):
-            st.text("\n".join(result["log"]))
+            st.text("\n".join(format_log(result["log_events"])))
 
 
 def section_target(use_cache: bool) -> None:
@@ -84,7 +109,7 @@ def section_target(use_cache: bool) -> None:
             st.error("Укажите SECID.")
             return
         try:
-            bond = get_bond_cached(secid, CACHE_PATH, use_cache=use_cache)
+            bond = _get_bond(secid, use_cache)
             res = find_min_qty_for_target(
                 bond=bond,
                 purchase_date=purchase_date,
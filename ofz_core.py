@@ -5,24 +5,100 @@
 
 from __future__ import annotations
 
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime
 from pathlib import Path
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional
-import json
+import logging
+import math
+import re
+import time
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
 
 BASE_URL = "https://iss.moex.com/iss"
+# Выпуски с плавающим (ПК), индексируемым (ИН) и амортизируемым (АД) купоном.
+# Тип виден в SECNAME («ОФЗ-ПК 29006 ...»); в SHORTNAME («ОФЗ 29006») его нет.
+_NON_FIXED_SECNAME = re.compile(r"ОФЗ-(ПК|ИН|АД)")
+# Серии таких выпусков по номеру в SECID: SU24/SU29 — ПК, SU52 — ИН, SU46 — АД.
+_NON_FIXED_SERIES = {"24", "29", "52", "46"}
+
+# Общая сессия: keep-alive переиспользует TCP/TLS-соединение с iss.moex.com
+# между запросами (массовая загрузка кэша делает по 2 запроса на бумагу).
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    ),
+)
+_SESSION.headers.update({"Accept-Encoding": "gzip", "User-Agent": "ofz_calc/1.0"})
+
+# Время жизни ответов ISS в памяти процесса: котировки меняются быстро,
+# график купонов фиксированного выпуска практически статичен.
+MARKET_TTL = 60
+COUPONS_TTL = 24 * 60 * 60
+# (url, параметры) -> (момент устаревания по time.monotonic(), разобранный JSON).
+_HTTP_CACHE: Dict[tuple, Tuple[float, Dict]] = {}
+
+
+def _http_cache_key(url: str, params: Optional[Dict]) -> tuple:
+    return (url, tuple(sorted((params or {}).items())))
+
+
+def _http_cache_get(key: tuple) -> Optional[Dict]:
+    hit = _HTTP_CACHE.get(key)
+    if hit is not None and hit[0] > time.monotonic():
+        return hit[1]
+    return None
+
+
+def _http_cache_put(key: tuple, data: Dict, ttl: float) -> None:
+    now = time.monotonic()
+    if len(_HTTP_CACHE) >= 1024:
+        for old_key, (expires, _) in list(_HTTP_CACHE.items()):
+            if expires <= now:
+                _HTTP_CACHE.pop(old_key, None)
+    _HTTP_CACHE[key] = (now + ttl, data)
+
+
+def cached_get_json(url: str, params: Optional[Dict] = None, ttl: float = MARKET_TTL, timeout: float = 15) -> Dict:
+    """GET к MOEX ISS с разбором JSON; одинаковый запрос в течение ttl секунд не повторяется."""
+    key = _http_cache_key(url, params)
+    data = _http_cache_get(key)
+    if data is not None:
+        return data
+
+    resp = _SESSION.get(url, params=params, timeout=timeout)
+    resp.raise_for_status()
+    data = orjson.loads(resp.content)
+    _http_cache_put(key, data, ttl)
+    return data
+
+
+_THOUSANDS_SEP = str.maketrans({",": " "})
 
 
 def fmt_rub(value: float | int) -> str:
     """Форматирует сумму в рублях с разделением тысяч пробелами."""
-    s = f"{value:,.2f}"
-    int_part, dot, frac = s.partition(".")
-    int_part = int_part.replace(",", " ")
-    return int_part + (dot + frac if dot else "")
+    return format(value, ",.2f").translate(_THOUSANDS_SEP)
 
 
 def _parse_float(value) -> float:
+    # ISS отдаёт числовые столбцы JSON-числами — это самый частый случай.
+    t = type(value)
+    if t is float:
+        return value
+    if t is int:
+        return float(value)
     if value is None or value == "":
         return 0.0
     if isinstance(value, str):
@@ -33,34 +109,113 @@ def _parse_float(value) -> float:
         return 0.0
 
 
-def fetch_bond(secid: str) -> Dict:
-    """Получает цену, НКД и график купонов для облигации с фиксированным купоном."""
-    secid = secid.upper().strip()
+@lru_cache(maxsize=4096)
+def _pdate(s: str) -> date:
+    """Разбирает дату ISS вида YYYY-MM-DD без strptime (даты купонов часто повторяются)."""
+    return date.fromisoformat(s[:10])
+
+
+# Денежный шаг расчёта реинвеста — 1/10000 рубля: суммы купонов ISS приходят
+# с точностью до 4 знаков, в таких единицах арифметика целочисленная и точная.
+_UNITS = 10_000
+# Остаток на счёте округляется до копеек.
+_KOPECK = _UNITS // 100
+
+
+def _to_units(value: float) -> int:
+    return round(value * _UNITS)
+
 
-    url = f"{BASE_URL}/engines/stock/markets/bonds/securities/{secid}.json"
+def _coupon_schedule(bond: Dict) -> Tuple[List[int], List[int], int]:
+    """
+    Купоны в виде параллельных списков: даты (ordinal), суммы в _UNITS и индекс
+    первого купона в дату погашения или позже (он не реинвестируется).
+    Считается один раз и хранится в bond["_schedule"] вместе со списком купонов
+    и датой погашения, из которых построен: копия bond с другими купонами
+    ({**bond, "coupons": ...}) получает новый график, а не унаследованный.
+    """
+    coupons = bond["coupons"]
+    maturity_date = bond["maturity_date"]
+    stored = bond.get("_schedule")
+    if (
+        stored is None
+        or stored[0] is not coupons
+        or stored[1] != maturity_date
+        or len(stored[2][0]) != len(coupons)
+    ):
+        stored = _store_schedule(
+            bond,
+            [d.toordinal() for d, _ in coupons],
+            [v for _, v in coupons],
+            maturity_date.toordinal(),
+        )
+    return stored[2]
+
+
+def _store_schedule(
+    bond: Dict, pay_ords: List[int], values: List[float], maturity_ord: int
+) -> Tuple:
+    schedule = (pay_ords, [_to_units(v) for v in values], bisect_left(pay_ords, maturity_ord))
+    stored = bond["_schedule"] = (bond["coupons"], bond["maturity_date"], schedule)
+    return stored
+
+
+# Длиннее этого фильтр securities= ISS соблюдать не обязан.
+_SECURITIES_FILTER_MAX = 10
+
+
+def _fetch_static_and_market(secids: List[str]) -> Dict[str, Tuple[Dict, Dict]]:
+    """
+    Одним запросом получает строки securities и marketdata для списка SECID.
+    Короткий список уходит фильтром securities=, длинный — запросом по всему
+    рынку облигаций с отбором на нашей стороне.
+    Возвращает secid -> (securities, marketdata), marketdata — с TQOB/TQOD, если есть.
+    """
+    url = f"{BASE_URL}/engines/stock/markets/bonds/securities.json"
+    wanted = set(secids)
     params = {
         "iss.meta": "off",
+        "iss.only": "securities,marketdata",
         "securities.columns": "SECID,FACEVALUE,MATDATE",
         "marketdata.columns": "SECID,BOARDID,LAST,PREVPRICE,ACCRUEDINT",
     }
-    resp = requests.get(url, params=params, timeout=15)
-    resp.raise_for_status()
-    data = resp.json()
-
-    sec = dict(zip(data["securities"]["columns"], data["securities"]["data"][0]))
-    face_value = float(sec.get("FACEVALUE", 1000))
-    maturity_date = datetime.strptime(sec["MATDATE"], "%Y-%m-%d").date()
+    if len(wanted) <= _SECURITIES_FILTER_MAX:
+        params["securities"] = ",".join(sorted(wanted))
+    data = cached_get_json(url, params, ttl=MARKET_TTL, timeout=20)
+
+    sec_cols = data["securities"]["columns"]
+    sec_secid_idx = sec_cols.index("SECID")
+    secs: Dict[str, Dict] = {}
+    for row in data["securities"]["data"]:
+        secid = row[sec_secid_idx]
+        if secid in wanted and secid not in secs:
+            secs[secid] = dict(zip(sec_cols, row))
 
-    market_rows = data["marketdata"]["data"]
     market_cols = data["marketdata"]["columns"]
-    market = next(
-        (
-            dict(zip(market_cols, row))
-            for row in market_rows
-            if dict(zip(market_cols, row)).get("BOARDID") in ("TQOB", "TQOD")
-        ),
-        dict(zip(market_cols, market_rows[0])) if market_rows else {},
-    )
+    secid_idx = market_cols.index("SECID")
+    board_idx = market_cols.index("BOARDID")
+    market_rows: Dict[str, list] = {}
+    for row in data["marketdata"]["data"]:
+        if row[secid_idx] not in secs:
+            continue
+        # Первая строка бумаги — запасной вариант, TQOB/TQOD её вытесняет.
+        current = market_rows.get(row[secid_idx])
+        if current is None or (
+            row[board_idx] in ("TQOB", "TQOD") and current[board_idx] not in ("TQOB", "TQOD")
+        ):
+            market_rows[row[secid_idx]] = row
+
+    rows: Dict[str, Tuple[Dict, Dict]] = {}
+    for secid, sec in secs.items():
+        market_row = market_rows.get(secid)
+        rows[secid] = (sec, dict(zip(market_cols, market_row)) if market_row else {})
+    return rows
+
+
+def _bond_prices(secid: str, sec: Dict, market: Dict) -> Dict:
+    """Номинал, дата погашения и цена покупки с НКД из строк securities/marketdata."""
+    face_value = float(sec.get("FACEVALUE", 1000))
+    maturity_date = _pdate(sec["MATDATE"])
 
     clean_price_pct = _parse_float(market.get("LAST")) or _parse_float(
         market.get("PREVPRICE")
@@ -72,27 +227,92 @@ def fetch_bond(secid: str) -> Dict:
     clean_price_rub = clean_price_pct / 100 * face_value
     purchase_price_with_nkd = clean_price_rub + accrued_int
 
+    return {
+        "secid": secid,
+        "face_value": face_value,
+        "maturity_date": maturity_date,
+        "clean_price_rub": clean_price_rub,
+        "accrued_int": accrued_int,
+        "purchase_price_with_nkd": purchase_price_with_nkd,
+    }
+
+
+# Ответы bondization между запусками: по файлу на SECID, действителен в день записи.
+COUPONS_DIR = Path.home() / ".cache" / "ofz_calc"
+# SECID попадает в путь файла и в URL, поэтому допускаем только буквы и цифры.
+_SECID_RE = re.compile(r"[A-Z0-9]+")
+
+
+def _fetch_coupon_json(secid: str, use_disk_cache: bool = True) -> Dict:
+    """
+    Загружает блок coupons из bondization.
+    Порядок: память процесса, дневная копия на диске (если use_disk_cache), ISS.
+    """
     coupon_url = f"{BASE_URL}/securities/{secid}/bondization.json"
-    resp_coupon = requests.get(
-        coupon_url, params={"iss.meta": "off", "limit": 5000, "start": 0}, timeout=15
-    )
-    resp_coupon.raise_for_status()
-    coup_json = resp_coupon.json()
+    coupon_params = {
+        "iss.meta": "off",
+        "iss.only": "coupons",
+        "coupons.columns": "coupondate,startdate,value,value_rub,valueprc",
+        "limit": 5000,
+        "start": 0,
+    }
+    key = _http_cache_key(coupon_url, coupon_params)
+    data = _http_cache_get(key)
+    if data is not None:
+        return data
+    if not use_disk_cache or not _SECID_RE.fullmatch(secid):
+        return cached_get_json(coupon_url, coupon_params, ttl=COUPONS_TTL)
+
+    # График купонов фиксированного выпуска в течение дня не меняется, поэтому
+    # повторные запуски CLI берут его с диска, а не из сети.
+    disk_path = COUPONS_DIR / f"{secid}.json"
+    today = date.today().isoformat()
+    try:
+        stored = orjson.loads(disk_path.read_bytes())
+        if stored["date"] == today:
+            _http_cache_put(key, stored["data"], COUPONS_TTL)
+            return stored["data"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    data = cached_get_json(coupon_url, coupon_params, ttl=COUPONS_TTL)
+    try:
+        COUPONS_DIR.mkdir(parents=True, exist_ok=True)
+        disk_path.write_bytes(orjson.dumps({"date": today, "data": data}))
+    except OSError:
+        pass
+    return data
+
+
+def _fetch_coupons(
+    secid: str, face_value: float, use_disk_cache: bool = True
+) -> List[Tuple[date, float]]:
+    """Загружает график купонов (дата, сумма на бумагу), отсортированный по дате."""
+    return _parse_coupons(_fetch_coupon_json(secid, use_disk_cache), face_value)
+
+
+def _parse_coupons(coup_json: Dict, face_value: float) -> List[Tuple[date, float]]:
+    """
+    Разбирает блок coupons в список (дата, сумма на бумагу), отсортированный по дате.
+    Номинал нужен, чтобы пересчитать в рубли купоны, заданные только в % (valueprc).
+    """
     coup_cols = coup_json["coupons"]["columns"]
     coup_rows = coup_json["coupons"]["data"]
 
+    # Индексы нужных колонок ищем один раз, строки читаем по позиции.
+    ci_date, ci_start, ci_val, ci_valr, ci_pct = (
+        coup_cols.index(name) for name in ("coupondate", "startdate", "value", "value_rub", "valueprc")
+    )
+
     coupons: List[Tuple[date, float]] = []
     for row in coup_rows:
-        coupon = dict(zip(coup_cols, row))
-        pay_date = datetime.strptime(coupon["coupondate"], "%Y-%m-%d").date()
-        start_raw = coupon.get("startdate")
-        start_date = (
-            datetime.strptime(start_raw, "%Y-%m-%d").date() if start_raw else None
-        )
+        pay_date = _pdate(row[ci_date])
+        start_raw = row[ci_start]
+        start_date = _pdate(start_raw) if start_raw else None
 
-        value_nominal = _parse_float(coupon.get("value"))
-        value_rub = _parse_float(coupon.get("value_rub"))
-        value_pct = _parse_float(coupon.get("valueprc"))
+        value_nominal = _parse_float(row[ci_val])
+        value_rub = _parse_float(row[ci_valr])
+        value_pct = _parse_float(row[ci_pct])
 
         period_days = (pay_date - start_date).days if start_date else 0
         value_from_pct = (
@@ -110,16 +330,43 @@ def fetch_bond(secid: str) -> Dict:
         if value > 0:
             coupons.append((pay_date, round(value, 4)))
     coupons.sort(key=lambda x: x[0])
+    return coupons
 
-    return {
-        "secid": secid,
-        "face_value": face_value,
-        "maturity_date": maturity_date,
-        "clean_price_rub": clean_price_rub,
-        "accrued_int": accrued_int,
-        "purchase_price_with_nkd": purchase_price_with_nkd,
-        "coupons": coupons,
-    }
+
+# SECID -> (момент устаревания, разобранный bond): повторный fetch_bond в пределах
+# MARKET_TTL не разбирает ответы заново. Живёт столько же, сколько котировки.
+_BONDS: Dict[str, Tuple[float, Dict]] = {}
+
+
+def fetch_bond(secid: str, use_disk_cache: bool = True) -> Dict:
+    """
+    Получает цену, НКД и график купонов для облигации с фиксированным купоном.
+    use_disk_cache=False — купоны не берутся из дневной копии на диске.
+    """
+    secid = secid.upper().strip()
+    if not _SECID_RE.fullmatch(secid):
+        raise ValueError(f"Некорректный SECID: {secid}")
+    now = time.monotonic()
+    hit = _BONDS.get(secid)
+    if hit is not None and hit[0] > now:
+        # Поверхностная копия, чтобы вызывающий код не портил общий bond
+        return dict(hit[1])
+
+    # Запросы независимы (номинал нужен только при разборе купонов),
+    # поэтому оба уходят одновременно.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        rows_fut = ex.submit(_fetch_static_and_market, [secid])
+        coupons_fut = ex.submit(_fetch_coupon_json, secid, use_disk_cache)
+        rows = rows_fut.result()
+        coup_json = coupons_fut.result()
+
+    if secid not in rows:
+        raise ValueError(f"Бумага {secid} не найдена на MOEX")
+    bond = _bond_prices(secid, *rows[secid])
+    bond["coupons"] = _parse_coupons(coup_json, bond["face_value"])
+    _coupon_schedule(bond)
+    _BONDS[secid] = (now + MARKET_TTL, bond)
+    return dict(bond)
 
 
 def simulate_reinvest_detailed(
@@ -128,98 +375,257 @@ def simulate_reinvest_detailed(
     initial_qty: int,
     reinvest_price: float,
     allow_carry_over: bool = True,
+    build_log: bool = True,
 ) -> Dict:
     """
     Реинвестирует каждый купон в целые облигации по цене reinvest_price.
-    Возвращает расчёт и текстовый лог.
+    Возвращает расчёт и события лога (текст строит format_log по запросу).
+    build_log=False — только числа через simulate_reinvest_simple, лог пустой.
     """
-    qty = float(initial_qty)
-    cash = 0.0
     initial_investment = initial_qty * bond["purchase_price_with_nkd"]
-    log: List[str] = [
-        f"Покупка {purchase_date}: {initial_qty} шт. по {fmt_rub(bond['purchase_price_with_nkd'])} ₽ (с НКД)."
+    if not build_log:
+        res = simulate_reinvest_simple(
+            bond, purchase_date, initial_qty, reinvest_price, allow_carry_over
+        )
+        return _summary(
+            bond, purchase_date, res["final_qty"], res["final_amount"], initial_investment, []
+        )
+
+    qty = initial_qty
+    cash = 0
+    price_u = _to_units(reinvest_price)
+    log_events: List[Dict] = [
+        {
+            "kind": "purchase",
+            "date": purchase_date,
+            "qty": initial_qty,
+            "price": bond["purchase_price_with_nkd"],
+            "allow_carry_over": allow_carry_over,
+        }
     ]
-    log.append(
-        "Режим переноса остатка купонов: "
-        + ("включён — остаток идёт в следующий купон" if allow_carry_over else "выключен — остаток не переносится")
-    )
 
-    final_coupon_cash = 0.0
-    future_coupons = [c for c in bond["coupons"] if c[0] >= purchase_date]
+    final_coupon_cash = 0
+    pay_ords, values, maturity_idx = _coupon_schedule(bond)
+    start = bisect_left(pay_ords, purchase_date.toordinal())
+    future_coupons = bond["coupons"][start:]
 
     if not future_coupons:
-        log.append(
-            f"Купоны после {purchase_date} не найдены. Ожидается только погашение "
-            f"{bond['maturity_date']} без промежуточных выплат."
+        log_events.append(
+            {"kind": "no_coupons", "date": purchase_date, "maturity_date": bond["maturity_date"]}
         )
     else:
-        nearest_date, nearest_value = future_coupons[0]
-        log.append(
-            f"Купонов до погашения: {len(future_coupons)} шт., ближайший {nearest_date} "
-            f"на {fmt_rub(nearest_value)} ₽ за бумагу."
+        log_events.append(
+            {
+                "kind": "coupons_ahead",
+                "count": len(future_coupons),
+                "date": future_coupons[0][0],
+                "value": values[start] / _UNITS,
+            }
         )
 
-    for idx, (pay_date, coupon_value) in enumerate(future_coupons, start=1):
+    # Купоны отсортированы: граница последнего (нереинвестируемого) купона
+    # ищется один раз, а не сравнением дат на каждой итерации.
+    last_i = max(maturity_idx, start) - start
+
+    # Даты берём из bond["coupons"], суммы — из графика: _coupon_schedule
+    # гарантирует, что он построен ровно по этим купонам.
+    for idx, (pay_date, _) in enumerate(future_coupons[:last_i], start=1):
+        coupon_value = values[start + idx - 1]
         coupon_income = coupon_value * qty
-        carry_over = cash if allow_carry_over else 0.0
+        carry_over = cash if allow_carry_over else 0
         total_coupon = coupon_income + carry_over
-        is_last_coupon = pay_date >= bond["maturity_date"]
-
-        if is_last_coupon:
-            final_coupon_cash = total_coupon
-            cash = 0.0
-            log.append(
-                "\n".join(
-                    [
-                        f"Купон {idx} {pay_date} (последний):",
-                        f"  купон {fmt_rub(coupon_value)} ₽ × {qty:.0f} шт. = {fmt_rub(coupon_income)} ₽",
-                        f"  перенос с прошлых купонов: {fmt_rub(carry_over)} ₽",
-                        f"  всего к зачислению: {fmt_rub(total_coupon)} ₽ (не реинвестируется)",
-                    ]
-                )
-            )
-            break
 
-        reinvest_qty = int(total_coupon // reinvest_price)
-        reinvest_cost = reinvest_qty * reinvest_price
-        cash = round(total_coupon - reinvest_cost, 2) if allow_carry_over else 0.0
+        reinvest_qty, rest = divmod(total_coupon, price_u)
+        cash = (rest + _KOPECK // 2) // _KOPECK * _KOPECK if allow_carry_over else 0
+        if cash >= price_u:
+            # Округление до копеек дотянуло остаток до цены бумаги — докупаем её.
+            reinvest_qty += 1
+            cash -= price_u
         prev_qty = qty
         qty += reinvest_qty
 
-        log.append(
-            "\n".join(
-                [
-                    f"Купон {idx} {pay_date}:",
-                    f"  купон {fmt_rub(coupon_value)} ₽ × {prev_qty:.0f} шт. = {fmt_rub(coupon_income)} ₽",
-                    f"  перенос с прошлых купонов: {fmt_rub(carry_over)} ₽",
-                    f"  всего доступно для докупки: {fmt_rub(total_coupon)} ₽",
-                    f"  докуплено {reinvest_qty} шт. по {fmt_rub(reinvest_price)} ₽ = {fmt_rub(reinvest_cost)} ₽",
-                    f"  остаток после докупки: {fmt_rub(cash)} ₽; итоговое количество: {qty:.0f} шт.",
-                ]
-            )
+        log_events.append(
+            {
+                "kind": "coupon",
+                "idx": idx,
+                "date": pay_date,
+                "value": coupon_value / _UNITS,
+                "qty": prev_qty,
+                "income": coupon_income / _UNITS,
+                "carry_over": carry_over / _UNITS,
+                "total": total_coupon / _UNITS,
+                "is_last": False,
+                "reinvest_qty": reinvest_qty,
+                "reinvest_price": reinvest_price,
+                "reinvest_cost": reinvest_qty * price_u / _UNITS,
+                "cash": cash / _UNITS,
+                "qty_after": qty,
+            }
+        )
+
+    if last_i < len(future_coupons):
+        pay_date = future_coupons[last_i][0]
+        coupon_value = values[start + last_i]
+        coupon_income = coupon_value * qty
+        carry_over = cash if allow_carry_over else 0
+        final_coupon_cash = coupon_income + carry_over
+        cash = 0
+        log_events.append(
+            {
+                "kind": "coupon",
+                "idx": last_i + 1,
+                "date": pay_date,
+                "value": coupon_value / _UNITS,
+                "qty": qty,
+                "income": coupon_income / _UNITS,
+                "carry_over": carry_over / _UNITS,
+                "total": final_coupon_cash / _UNITS,
+                "is_last": True,
+            }
         )
 
     redemption = qty * bond["face_value"]
-    final_amount = redemption + final_coupon_cash + cash
+    tail = (final_coupon_cash + cash) / _UNITS
+    final_amount = (qty * _to_units(bond["face_value"]) + final_coupon_cash + cash) / _UNITS
+
+    log_events.append(
+        {
+            "kind": "redemption",
+            "date": bond["maturity_date"],
+            "redemption": redemption,
+            "tail": tail,
+            "final_amount": final_amount,
+        }
+    )
+
+    return _summary(bond, purchase_date, qty, final_amount, initial_investment, log_events)
+
+
+def _summary(
+    bond: Dict,
+    purchase_date: date,
+    qty: float,
+    final_amount: float,
+    initial_investment: float,
+    log_events: List[Dict],
+) -> Dict:
     profit = final_amount - initial_investment
     years = (bond["maturity_date"] - purchase_date).days / 365.25
     annualized = (profit / initial_investment) / years * 100 if years > 0 else 0.0
-
-    log.append(
-        f"Погашение {bond['maturity_date']}: номинал {fmt_rub(redemption)} ₽ + "
-        f"финальный купон/остаток {fmt_rub(final_coupon_cash + cash)} ₽ = {fmt_rub(final_amount)} ₽."
-    )
-
     return {
         "final_quantity": int(qty),
         "final_amount": final_amount,
         "initial_investment": initial_investment,
         "profit": profit,
         "annualized_return": annualized,
-        "log": log,
+        "log_events": log_events,
     }
 
 
+def format_log(events: List[Dict]) -> List[str]:
+    """Превращает события simulate_reinvest_detailed в плоский список строк лога."""
+    log: List[str] = []
+    for ev in events:
+        kind = ev["kind"]
+        if kind == "purchase":
+            log.append(
+                f"Покупка {ev['date']}: {ev['qty']} шт. по {fmt_rub(ev['price'])} ₽ (с НКД)."
+            )
+            log.append(
+                "Режим переноса остатка купонов: "
+                + (
+                    "включён — остаток идёт в следующий купон"
+                    if ev["allow_carry_over"]
+                    else "выключен — остаток не переносится"
+                )
+            )
+        elif kind == "no_coupons":
+            log.append(
+                f"Купоны после {ev['date']} не найдены. Ожидается только погашение "
+                f"{ev['maturity_date']} без промежуточных выплат."
+            )
+        elif kind == "coupons_ahead":
+            log.append(
+                f"Купонов до погашения: {ev['count']} шт., ближайший {ev['date']} "
+                f"на {fmt_rub(ev['value'])} ₽ за бумагу."
+            )
+        elif kind == "coupon" and ev["is_last"]:
+            log.extend(
+                [
+                    f"Купон {ev['idx']} {ev['date']} (последний):",
+                    f"  купон {fmt_rub(ev['value'])} ₽ × {ev['qty']:.0f} шт. = {fmt_rub(ev['income'])} ₽",
+                    f"  перенос с прошлых купонов: {fmt_rub(ev['carry_over'])} ₽",
+                    f"  всего к зачислению: {fmt_rub(ev['total'])} ₽ (не реинвестируется)",
+                ]
+            )
+        elif kind == "coupon":
+            log.extend(
+                [
+                    f"Купон {ev['idx']} {ev['date']}:",
+                    f"  купон {fmt_rub(ev['value'])} ₽ × {ev['qty']:.0f} шт. = {fmt_rub(ev['income'])} ₽",
+                    f"  перенос с прошлых купонов: {fmt_rub(ev['carry_over'])} ₽",
+                    f"  всего доступно для докупки: {fmt_rub(ev['total'])} ₽",
+                    f"  докуплено {ev['reinvest_qty']} шт. по {fmt_rub(ev['reinvest_price'])} ₽ = {fmt_rub(ev['reinvest_cost'])} ₽",
+                    f"  остаток после докупки: {fmt_rub(ev['cash'])} ₽; итоговое количество: {ev['qty_after']:.0f} шт.",
+                ]
+            )
+        elif kind == "redemption":
+            log.append(
+                f"Погашение {ev['date']}: номинал {fmt_rub(ev['redemption'])} ₽ + "
+                f"финальный купон/остаток {fmt_rub(ev['tail'])} ₽ = {fmt_rub(ev['final_amount'])} ₽."
+            )
+    return log
+
+
+def _reinvest_core(
+    values: List[int],
+    start: int,
+    last: int,
+    initial_qty: int,
+    reinvest_price: float,
+    face_value: float,
+    allow_carry_over: bool,
+) -> Tuple[int, float]:
+    """
+    Чистая арифметика реинвеста: купоны [start, last) докупают бумаги,
+    купон last (если есть) — последний, без реинвеста.
+    values — суммы купонов в _UNITS, счёт целочисленный.
+    Возвращает (количество, сумма к погашению в рублях).
+    """
+    qty = initial_qty
+    price_u = _to_units(reinvest_price)
+    face_u = _to_units(face_value)
+
+    if not allow_carry_over:
+        # Без переноса остаток всегда 0: докупка зависит только от текущего количества.
+        for value in values[start:last]:
+            qty += value * qty // price_u
+        final_coupon_cash = values[last] * qty if last < len(values) else 0
+        return qty, (qty * face_u + final_coupon_cash) / _UNITS
+
+    cash = 0
+    final_coupon_cash = 0
+    # Глобальные имена в цикле — локальные переменные: меньше поиска по словарям.
+    kopeck = _KOPECK
+    half_kopeck = _KOPECK // 2
+    _divmod = divmod
+
+    for value in values[start:last]:
+        reinvest_qty, rest = _divmod(value * qty + cash, price_u)
+        cash = (rest + half_kopeck) // kopeck * kopeck
+        if cash >= price_u:
+            # Округление до копеек дотянуло остаток до цены бумаги — докупаем её.
+            reinvest_qty += 1
+            cash -= price_u
+        qty += reinvest_qty
+
+    if last < len(values):
+        final_coupon_cash = values[last] * qty + cash
+        cash = 0
+
+    return qty, (qty * face_u + final_coupon_cash + cash) / _UNITS
+
+
 def simulate_reinvest_simple(
     bond: Dict,
     purchase_date: date,
@@ -228,25 +634,17 @@ def simulate_reinvest_simple(
     allow_carry_over: bool = True,
 ) -> Dict:
     """Упрощённая симуляция без лога (для бинарного поиска)."""
-    qty = float(initial_qty)
-    cash = 0.0
-    final_coupon_cash = 0.0
-
-    for pay_date, coupon_value in (c for c in bond["coupons"] if c[0] >= purchase_date):
-        total_coupon = coupon_value * qty + (cash if allow_carry_over else 0.0)
-        is_last_coupon = pay_date >= bond["maturity_date"]
-
-        if is_last_coupon:
-            final_coupon_cash = total_coupon
-            cash = 0.0
-            break
-
-        reinvest_qty = int(total_coupon // reinvest_price)
-        cash = round(total_coupon - reinvest_qty * reinvest_price, 2) if allow_carry_over else 0.0
-        qty += reinvest_qty
-
-    redemption = qty * bond["face_value"]
-    final_amount = redemption + final_coupon_cash + cash
+    pay_ords, values, maturity_idx = _coupon_schedule(bond)
+    start = bisect_left(pay_ords, purchase_date.toordinal())
+    qty, final_amount = _reinvest_core(
+        values,
+        start,
+        max(maturity_idx, start),
+        initial_qty,
+        reinvest_price,
+        bond["face_value"],
+        allow_carry_over,
+    )
     return {"final_amount": final_amount, "final_qty": int(qty)}
 
 
@@ -255,77 +653,125 @@ def find_min_qty_for_target(
 ) -> Dict:
     """Подбирает минимальное целое количество, дающее сумму >= target_amount."""
     reinvest_price = bond["face_value"]
+    face_value = bond["face_value"]
+    # Купоны отсортированы: границы будущих купонов ищем один раз на весь поиск
+    # и дальше гоняем только арифметическое ядро, без обёртки simulate_reinvest_simple.
+    pay_ords, values, maturity_idx = _coupon_schedule(bond)
+    start = bisect_left(pay_ords, purchase_date.toordinal())
+    last = max(maturity_idx, start)
+    # Симуляция детерминирована по количеству при фиксированных bond/дате,
+    # поэтому каждое количество считаем не больше одного раза.
+    memo: Dict[int, float] = {}
+
+    def final_amount(qty: int) -> float:
+        value = memo.get(qty)
+        if value is None:
+            value = memo[qty] = _reinvest_core(
+                values, start, last, qty, reinvest_price, face_value, allow_carry_over
+            )[1]
+        return value
 
     qty = 1
-    result = simulate_reinvest_simple(
-        bond, purchase_date, qty, reinvest_price, allow_carry_over=allow_carry_over
-    )
-    if result["final_amount"] >= target_amount:
-        return {"initial_qty": qty, "final_amount": result["final_amount"]}
-
+    if final_amount(qty) >= target_amount:
+        return {"initial_qty": qty, "final_amount": final_amount(qty)}
+
+    # Сумма к погашению почти линейна по количеству, поэтому следующую границу
+    # берём интерполяцией по последней точке: qty * target / f(qty). Из-за
+    # округления докупок f растёт чуть быстрее линейной, и оценка по текущей
+    # точке точнее, чем по одной бумаге.
+    # Оценка за пределом количества сразу упирается в предел: сумма монотонна
+    # по количеству, так что недостижимость цели проверяется одной симуляцией.
+    max_qty = 10_000_000
     lower_qty = qty
-    lower_val = result["final_amount"]
-    upper_qty = qty * 2
+    upper_qty = min(max_qty, max(qty * 2, math.ceil(target_amount / final_amount(qty))))
     while True:
-        upper_res = simulate_reinvest_simple(
-            bond, purchase_date, upper_qty, reinvest_price, allow_carry_over=allow_carry_over
-        )
-        if upper_res["final_amount"] >= target_amount:
+        upper_val = final_amount(upper_qty)
+        if upper_val >= target_amount:
             break
-        lower_qty, lower_val = upper_qty, upper_res["final_amount"]
-        upper_qty *= 2
-        if upper_qty > 10_000_000:
+        if upper_qty >= max_qty:
             raise ValueError("Слишком большая целевая сумма, подберите меньшую или снизьте дату.")
+        lower_qty = upper_qty
+        upper_qty = min(
+            max_qty, max(upper_qty + 1, math.ceil(upper_qty * target_amount / upper_val))
+        )
 
-    best_qty = upper_qty
-    best_val = upper_res["final_amount"]
-    left, right = lower_qty + 1, upper_qty
-    while left <= right:
-        mid = (left + right) // 2
-        mid_res = simulate_reinvest_simple(
-            bond, purchase_date, mid, reinvest_price, allow_carry_over=allow_carry_over
+    # Интерполяционный поиск в (lower_qty, upper_qty]: хорда между границами
+    # обычно попадает в ответ или соседнее количество, его проверяем сразу.
+    # На ступеньках округления (без переноса остатка при малых количествах)
+    # интерполяция сходится плохо — тогда шаг делаем пополам.
+    while upper_qty - lower_qty > 1:
+        span = upper_qty - lower_qty
+        lower_val = final_amount(lower_qty)
+        upper_val = final_amount(upper_qty)
+        probe = lower_qty + math.ceil(
+            (target_amount - lower_val) * span / (upper_val - lower_val)
         )
-        if mid_res["final_amount"] >= target_amount:
-            if mid_res["final_amount"] < best_val or mid < best_qty:
-                best_qty, best_val = mid, mid_res["final_amount"]
-            right = mid - 1
+        probe = min(max(probe, lower_qty + 1), upper_qty - 1)
+        if final_amount(probe) >= target_amount:
+            upper_qty, neighbour = probe, probe - 1
         else:
-            left = mid + 1
+            lower_qty, neighbour = probe, probe + 1
+        if lower_qty < neighbour < upper_qty:
+            if final_amount(neighbour) >= target_amount:
+                upper_qty = neighbour
+            else:
+                lower_qty = neighbour
+        if upper_qty - lower_qty > span >> 1:
+            mid = (lower_qty + upper_qty) >> 1
+            if final_amount(mid) >= target_amount:
+                upper_qty = mid
+            else:
+                lower_qty = mid
+
+    return {"initial_qty": upper_qty, "final_amount": final_amount(upper_qty)}
+
 
-    return {"initial_qty": best_qty, "final_amount": best_val}
+# Версия формата кэша: 2 — даты хранятся как ordinal (int), 1 — ISO-строки.
+CACHE_SCHEMA = 2
 
 
 def save_cache(data: Dict[str, Dict], path: Path) -> None:
-    """Сохраняет словарь bond-ов, конвертируя даты в строки для JSON."""
-    serializable = {}
-    for secid, bond in data.items():
-        serializable[secid] = {
-            **bond,
-            "maturity_date": bond["maturity_date"].isoformat()
-            if isinstance(bond["maturity_date"], (date, datetime))
-            else bond["maturity_date"],
-            "coupons": [
-                (d.isoformat() if isinstance(d, (date, datetime)) else d, v)
-                for d, v in bond["coupons"]
-            ],
+    """Сохраняет словарь bond-ов; даты пишутся как ordinal, чтобы не разбирать их при чтении."""
+    serializable = {
+        secid: {
+            **{k: v for k, v in bond.items() if not k.startswith("_")},
+            "maturity_date": bond["maturity_date"].toordinal(),
+            "coupons": [(d.toordinal(), v) for d, v in bond["coupons"]],
         }
-
-    path.write_text(
-        json.dumps(
-            {"updated_at": datetime.utcnow().isoformat(), "items": serializable},
-            ensure_ascii=False,
-        ),
-        encoding="utf-8",
+        for secid, bond in data.items()
+    }
+    path.write_bytes(
+        orjson.dumps(
+            {"schema": CACHE_SCHEMA, "updated_at": datetime.utcnow(), "items": serializable},
+            option=orjson.OPT_NON_STR_KEYS,
+        )
     )
 
 
+# Разобранный кэш в памяти процесса: (путь, mtime, размер) -> данные.
+_MEM: Dict[tuple, Dict] = {}
+# Bond-ы из _MEM с восстановленными датами: (путь, secid) -> bond.
+# Сбрасывается вместе с _MEM, когда файл кэша меняется.
+_DECODED: Dict[tuple, Dict] = {}
+
+
 def load_cache(path: Path) -> Optional[Dict]:
+    """Читает JSON-кэш; повторно разбирает файл только если он изменился."""
     if not path.exists():
         return None
     try:
-        return json.loads(path.read_text(encoding="utf-8"))
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        hit = _MEM.get(key)
+        if hit is not None:
+            return hit
+        data = orjson.loads(path.read_bytes())
     except Exception:
         return None
+    _MEM.clear()
+    _DECODED.clear()
+    _MEM[key] = data
+    return data
 
 
 def _fetch_ofz_list() -> List[Dict]:
@@ -335,25 +781,38 @@ def _fetch_ofz_list() -> List[Dict]:
         "iss.meta": "off",
         "iss.only": "securities",
         "limit": 5000,
-        "securities.columns": "SECID,SHORTNAME,FACEVALUE,COUPONTYPE,COUPONPERCENT",
+        "securities.columns": "SECID,SHORTNAME,SECNAME,FACEVALUE,COUPONTYPE,COUPONPERCENT",
     }
-    resp = requests.get(url, params=params, timeout=20)
-    resp.raise_for_status()
-    data = resp.json()
+    data = cached_get_json(url, params, ttl=MARKET_TTL, timeout=20)
     cols = data["securities"]["columns"]
     rows = data["securities"]["data"]
 
+    # В ответе все облигации рынка, большинство — не ОФЗ: отсеиваем их по
+    # SECID через индекс колонки и собираем dict только для строк SU.
+    # Остальные поля читаем через get: ISS молча пропускает неизвестные колонки.
+    ci_secid = cols.index("SECID")
+
     ofz_rows = []
+    seen = set()
     for row in rows:
+        secid = str(row[ci_secid] or "").upper()
+        # Одна бумага торгуется на нескольких бордах — берём первую строку.
+        if not secid.startswith("SU") or secid in seen:
+            continue
+        # Серия по SECID отсекает ПК/ИН/АД, даже если ISS не вернул SECNAME.
+        if secid[2:4] in _NON_FIXED_SERIES:
+            continue
         item = dict(zip(cols, row))
-        secid = str(item.get("SECID", "")).upper()
         coupontype = (item.get("COUPONTYPE") or "").upper()
-        shortname = item.get("SHORTNAME", "")
-        if not secid.startswith("SU"):
-            continue
+        shortname = item.get("SHORTNAME") or ""
         # Отбрасываем плавающие/индексируемые купоны, если можно определить.
         if coupontype in {"FLOAT", "VARIABLE", "INFL", "AMORT"}:
             continue
+        if _NON_FIXED_SECNAME.search((item.get("SECNAME") or "").upper()):
+            continue
+        if _parse_float(item.get("COUPONPERCENT")) <= 0:
+            continue
+        seen.add(secid)
         ofz_rows.append(
             {
                 "SECID": secid,
@@ -366,23 +825,70 @@ def _fetch_ofz_list() -> List[Dict]:
     return ofz_rows
 
 
-def download_fixed_ofz_cache(cache_path: Path) -> Dict[str, Dict]:
+def download_fixed_ofz_cache(cache_path: Path, use_disk_cache: bool = True) -> Dict[str, Dict]:
     """
     Скачивает данные по всем найденным ОФЗ (фикс. купон по эвристике) и сохраняет кэш.
+    use_disk_cache=False — купоны не берутся из дневных копий на диске.
     Возвращает словарь secid -> bond dict.
     """
     bonds: Dict[str, Dict] = {}
-    for item in _fetch_ofz_list():
-        secid = item["SECID"]
+    # Цены и реквизиты всех бумаг приходят одним запросом, по отдельности — только купоны.
+    secids = [item["SECID"] for item in _fetch_ofz_list()]
+    rows = _fetch_static_and_market(secids)
+    missing = [secid for secid in secids if secid not in rows]
+    if missing:
+        logger.warning("MOEX не вернул реквизиты %d бумаг: %s", len(missing), ", ".join(missing))
+
+    prices: Dict[str, Dict] = {}
+    for secid, (sec, market) in rows.items():
         try:
-            bonds[secid] = fetch_bond(secid)
+            prices[secid] = _bond_prices(secid, sec, market)
         except Exception:
-            # Пропускаем бумаги, которые не удалось загрузить
+            # Пропускаем бумаги без цены или реквизитов
             continue
+
+    # Загрузка упирается в ожидание MOEX, поэтому купоны качаем параллельно.
+    with ThreadPoolExecutor(max_workers=12) as ex:
+        futures = {
+            ex.submit(_fetch_coupons, secid, bond["face_value"], use_disk_cache): secid
+            for secid, bond in prices.items()
+        }
+        for fut in as_completed(futures):
+            secid = futures[fut]
+            try:
+                bonds[secid] = {**prices[secid], "coupons": fut.result()}
+            except Exception:
+                # Пропускаем бумаги, которые не удалось загрузить
+                continue
     save_cache(bonds, cache_path)
     return bonds
 
 
+def _decode_cached_bond(bond: Dict, schema: int) -> Dict:
+    """Восстанавливает даты bond-а из кэша в копии: исходный dict разделяется через _MEM."""
+    if schema >= 2:
+        pay_ords = [d for d, _ in bond["coupons"]]
+        values = [v for _, v in bond["coupons"]]
+        maturity_ord = bond["maturity_date"]
+        bond = {
+            **bond,
+            "maturity_date": date.fromordinal(maturity_ord),
+            "coupons": [(date.fromordinal(d), v) for d, v in bond["coupons"]],
+        }
+        _store_schedule(bond, pay_ords, values, maturity_ord)
+        return bond
+    bond = {
+        **bond,
+        "maturity_date": _pdate(bond["maturity_date"]),
+        "coupons": [
+            (_pdate(d), v) if isinstance(d, str) else (d, v)
+            for d, v in bond["coupons"]
+        ],
+    }
+    _coupon_schedule(bond)
+    return bond
+
+
 def get_bond_cached(secid: str, cache_path: Path, use_cache: bool = True) -> Dict:
     """
     Возвращает bond из кэша, если доступен и разрешён use_cache; иначе из API.
@@ -392,16 +898,16 @@ def get_bond_cached(secid: str, cache_path: Path, use_cache: bool = True) -> Dic
     if use_cache:
         cached = load_cache(cache_path)
         if cached and "items" in cached:
-            bond = cached["items"].get(secid_norm)
-            if bond:
-                # Восстанавливаем даты
-                bond["maturity_date"] = datetime.strptime(bond["maturity_date"], "%Y-%m-%d").date()
-                bond["coupons"] = [
-                    (datetime.strptime(d, "%Y-%m-%d").date(), v) if isinstance(d, str) else (d, v)
-                    for d, v in bond["coupons"]
-                ]
-                return bond
-    return fetch_bond(secid_norm)
+            key = (str(cache_path), secid_norm)
+            bond = _DECODED.get(key)
+            if bond is None:
+                raw = cached["items"].get(secid_norm)
+                if raw:
+                    bond = _DECODED[key] = _decode_cached_bond(raw, cached.get("schema", 1))
+            if bond is not None:
+                # Поверхностная копия, чтобы вызывающий код не портил общий bond
+                return dict(bond)
+    return fetch_bond(secid_norm, use_disk_cache=use_cache)
 
 
 def cache_info(cache_path: Path) -> Optional[str]:
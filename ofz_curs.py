@@ -4,8 +4,8 @@
 в целые облигации. Остаток купонов переносится на следующие периоды.
 """
 
-from datetime import date, datetime
-from ofz_core import fetch_bond, simulate_reinvest_detailed, fmt_rub
+from datetime import date
+from ofz_core import fetch_bond, format_log, simulate_reinvest_detailed, fmt_rub
 
 
 def main() -> None:
@@ -17,7 +17,7 @@ def main() -> None:
 
     date_raw = input("Дата покупки YYYY-MM-DD (Enter=сегодня): ").strip()
     purchase_date = (
-        datetime.strptime(date_raw, "%Y-%m-%d").date() if date_raw else date.today()
+        date.fromisoformat(date_raw) if date_raw else date.today()
     )
     qty = int(input("Количество при покупке (целое): ").strip())
     carry_ans = input("Переносить остаток купонов на следующий купон? [Y/n]: ").strip().lower()
@@ -47,7 +47,7 @@ def main() -> None:
     print(f"Прибыль: {fmt_rub(result['profit'])} ₽")
     print(f"Среднегодовая доходность: {result['annualized_return']:.2f} %")
     print("\nШаги реинвестирования:")
-    print("\n".join(result["log"]))
+    print("\n".join(format_log(result["log_events"])))
 
 
 if __name__ == "__main__":
@@ -1,12 +1,13 @@
-import json
 import math
 import os
+import re
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Any
 
-import requests
+import orjson
 
-from ofz_core import fmt_rub
+from ofz_core import COUPONS_TTL, cached_get_json, fmt_rub
 
 CACHE_FILE = "ofz_cache_parsed.json"
 NOMINAL = 1000  # номинал ОФЗ в рублях
@@ -16,28 +17,38 @@ DATE_FORMAT = "%Y-%m-%d"
 def load_cache(path: str = CACHE_FILE) -> Dict[str, Any]:
     if not os.path.exists(path):
         raise FileNotFoundError(f"Не найден кэш-файл {path}. Сначала запустите ofz_parser.py для его создания.")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
 
 
-def to_float(val: Any) -> float | None:
-    if val is None:
-        return None
-    if isinstance(val, (int, float)):
-        return float(val)
-    s = str(val).strip()
+# Символы, которые выбрасываем из строкового значения, и десятичная запятая.
+_STRIP = str.maketrans({",": ".", " ": "", "%": "", "Р": "", "р": ""})
+_RUB = re.compile(r"руб\.?")
+
+
+@lru_cache(maxsize=1024)
+def _str_to_float(s: str) -> float | None:
+    # убираем лишние символы за один проход str.translate
+    s = _RUB.sub("", s.strip()).translate(_STRIP)
     if not s:
         return None
-    # убираем лишние символы
-    for ch in ["%", "Р", "р", "руб", "руб."]:
-        s = s.replace(ch, "")
-    s = s.replace(" ", "").replace(",", ".")
     try:
         return float(s)
     except ValueError:
         return None
 
 
+def to_float(val: Any) -> float | None:
+    t = type(val)
+    if t is float:
+        return val
+    if val is None:
+        return None
+    if isinstance(val, (int, float)):
+        return float(val)
+    return _str_to_float(str(val))
+
+
 def to_int(val: Any) -> int | None:
     f = to_float(val)
     if f is None:
@@ -50,6 +61,7 @@ def choose_best_bond(bonds: List[Dict[str, Any]], target_income_year: float, yea
     в течение указанного количества лет при минимальных затратах на покупку.
     """
     best = None
+    best_cost = math.inf
 
     for b in bonds:
         coupon = to_float(b.get("coupon"))  # купон в рублях на одно начисление
@@ -77,20 +89,25 @@ def choose_best_bond(bonds: List[Dict[str, Any]], target_income_year: float, yea
         price_per_bond = NOMINAL * price_pct / 100.0
         total_cost = bonds_needed * price_per_bond
 
-        candidate = dict(b)
-        candidate.update(
-            {
-                "annual_coupon_per_bond": annual_coupon_per_bond,
-                "bonds_needed": bonds_needed,
-                "price_per_bond": price_per_bond,
-                "total_cost": total_cost,
-            }
-        )
+        # Копию выпуска собираем только для итогового победителя, а не для каждого кандидата.
+        if best is None or total_cost < best_cost:
+            best_cost = total_cost
+            best = (b, annual_coupon_per_bond, bonds_needed, price_per_bond)
 
-        if best is None or total_cost < best["total_cost"]:
-            best = candidate
+    if best is None:
+        return None
 
-    return best
+    b, annual_coupon_per_bond, bonds_needed, price_per_bond = best
+    candidate = dict(b)
+    candidate.update(
+        {
+            "annual_coupon_per_bond": annual_coupon_per_bond,
+            "bonds_needed": bonds_needed,
+            "price_per_bond": price_per_bond,
+            "total_cost": best_cost,
+        }
+    )
+    return candidate
 
 
 def fetch_coupon_schedule(secid: str, years_needed: float) -> List[Dict[str, Any]]:
@@ -98,9 +115,7 @@ def fetch_coupon_schedule(secid: str, years_needed: float) -> List[Dict[str, Any
     отфильтровывает выплаты только на ближайшие указанное количество лет.
     """
     url = f"https://iss.moex.com/iss/securities/{secid}/bondization.json"
-    resp = requests.get(url, timeout=20)
-    resp.raise_for_status()
-    j = resp.json()
+    j = cached_get_json(url, ttl=COUPONS_TTL, timeout=20)
 
     coupons_block = j.get("coupons", {})
     cols = coupons_block.get("columns", [])
@@ -125,6 +140,10 @@ def fetch_coupon_schedule(secid: str, years_needed: float) -> List[Dict[str, Any
 
     today = datetime.today().date()
     end_date = today + timedelta(days=int(years_needed * 365.25))
+    # Даты ISS приходят как YYYY-MM-DD: такие строки сравниваются так же, как даты,
+    # поэтому фильтруем без разбора каждой строки в date.
+    today_str = today.strftime(DATE_FORMAT)
+    end_str = end_date.strftime(DATE_FORMAT)
 
     future: List[Dict[str, Any]] = []
     all_future: List[Dict[str, Any]] = []
@@ -132,24 +151,20 @@ def fetch_coupon_schedule(secid: str, years_needed: float) -> List[Dict[str, Any
     for row in data:
         raw_date = row[idx_date]
         value = row[idx_value]
-        currency = row[idx_currency] if idx_currency is not None else "RUB"
         if not raw_date or value is None:
             continue
-        try:
-            d = datetime.strptime(raw_date[:10], "%Y-%m-%d").date()
-        except Exception:
-            continue
-        if d < today:
+        d = raw_date[:10]
+        if d < today_str:
             continue
 
         item = {
-            "date": d.strftime(DATE_FORMAT),
+            "date": d,
             "value": float(value),
-            "currency": currency,
+            "currency": row[idx_currency] if idx_currency is not None else "RUB",
         }
 
         all_future.append(item)
-        if d <= end_date:
+        if d <= end_str:
             future.append(item)
 
     # Если в выбранном окне ничего нет, вернём все будущие купоны
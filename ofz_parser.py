@@ -1,17 +1,33 @@
-import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict
+from typing import Dict, List, Optional
 
+import orjson
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 URL = "https://smart-lab.ru/q/ofz/?ofz_type=default&ysclid=mj6zviyhbz898653399"
 CACHE_FILE = "ofz_cache.json"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+# Одна сессия на все запросы: соединения с MOEX переиспользуются между бордами.
+# Повторы и заголовки те же, что в ofz_core; пул меньше — тут всего два борда и страница.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=4,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    ),
+)
+_SESSION.headers.update({"Accept-Encoding": "gzip", "User-Agent": "ofz_calc/1.0"})
+
 
 def fetch_moex_secid_map() -> Dict[str, str]:
     """
@@ -20,17 +36,31 @@ def fetch_moex_secid_map() -> Dict[str, str]:
     Используем два основных борда ОФЗ: TQOB и TQCB.
     """
     base = "https://iss.moex.com/iss/engines/stock/markets/bonds/boards/{board}/securities.json"
+    # Нужны только два столбца блока securities — остальное ISS не присылает.
+    params = {
+        "iss.meta": "off",
+        "iss.only": "securities",
+        "securities.columns": "SECID,SHORTNAME",
+    }
     secid_map: Dict[str, str] = {}
 
-    for board in ("TQOB", "TQCB"):
-        url = base.format(board=board)
+    def fetch_board(board: str):
         try:
-            resp = requests.get(url, timeout=20)
+            resp = _SESSION.get(base.format(board=board), params=params, timeout=20)
             resp.raise_for_status()
         except Exception:
+            return None
+        return resp
+
+    # Оба борда запрашиваем параллельно; map сохраняет порядок TQOB -> TQCB.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        responses = list(ex.map(fetch_board, ("TQOB", "TQCB")))
+
+    for resp in responses:
+        if resp is None:
             continue
 
-        j = resp.json()
+        j = orjson.loads(resp.content)
         sec_block = j.get("securities", {})
         cols = sec_block.get("columns", [])
         data = sec_block.get("data", [])
@@ -61,10 +91,11 @@ def fetch_ofz_data() -> Dict:
         "bonds": [ { ... }, ... ]
     }
     """
-    resp = requests.get(URL, timeout=20)
+    resp = _SESSION.get(URL, timeout=20)
     resp.raise_for_status()
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    # lxml — сишный парсер, заметно быстрее встроенного html.parser на таблице котировок
+    soup = BeautifulSoup(resp.text, "lxml")
 
     # На странице основная таблица ОФЗ - ищем её по заголовку или структуре.
     # Берём первую таблицу с заголовком, содержащим "Котировки ОФЗ" либо просто первую большую таблицу.
@@ -89,30 +120,36 @@ def fetch_ofz_data() -> Dict:
     header_cells = table.find("thead").find_all("th") if table.find("thead") else table.find("tr").find_all("th")
     headers = [" ".join(h.get_text(strip=True).split()) for h in header_cells]
 
-    # Индексы интересующих столбцов (по тексту заголовков, могут немного меняться)
-    def find_idx(substr: str) -> int | None:
-        """
-        Ищет индекс столбца по подстроке в заголовке.
-
-        У некоторых заголовков на smart-lab могут быть переносы строк (<br>),
-        поэтому дополнительно сравниваем варианты без пробелов.
-        """
-        substr_lower = substr.lower()
-        substr_compact = substr_lower.replace(" ", "")
-        for i, name in enumerate(headers):
-            name_lower = name.lower()
-            name_compact = name_lower.replace(" ", "")
-            if substr_lower in name_lower or substr_compact in name_compact:
-                return i
-        return None
-
-    idx_name = find_idx("Имя")
-    idx_maturity = find_idx("Погашение")
-    idx_years = find_idx("Лет до погаш")
-    idx_yield = find_idx("Доходн")
-    idx_price = find_idx("Цена")
-    idx_coupon = find_idx("Купон")
-    idx_freq = find_idx("Частота")
+    # Индексы интересующих столбцов (по тексту заголовков, могут немного меняться).
+    # У некоторых заголовков на smart-lab могут быть переносы строк (<br>),
+    # поэтому дополнительно сравниваем варианты без пробелов. Заголовки
+    # нормализуем один раз и ищем все столбцы за один проход.
+    normalized = [(name.lower(), name.lower().replace(" ", "")) for name in headers]
+    targets = {
+        "name": "Имя",
+        "maturity": "Погашение",
+        "years": "Лет до погаш",
+        "yield": "Доходн",
+        "price": "Цена",
+        "coupon": "Купон",
+        "freq": "Частота",
+    }
+    target_forms = [
+        (key, substr.lower(), substr.lower().replace(" ", "")) for key, substr in targets.items()
+    ]
+    idx: Dict[str, Optional[int]] = dict.fromkeys(targets)
+    for i, (name_lower, name_compact) in enumerate(normalized):
+        for key, substr_lower, substr_compact in target_forms:
+            if idx[key] is None and (substr_lower in name_lower or substr_compact in name_compact):
+                idx[key] = i
+
+    idx_name = idx["name"]
+    idx_maturity = idx["maturity"]
+    idx_years = idx["years"]
+    idx_yield = idx["yield"]
+    idx_price = idx["price"]
+    idx_coupon = idx["coupon"]
+    idx_freq = idx["freq"]
 
     # Получим карту SHORTNAME -> SECID с Московской биржи
     try:
@@ -136,7 +173,7 @@ def fetch_ofz_data() -> Dict:
 
         name = get_cell(idx_name)
         bond = {
-            "name": get_cell(idx_name),
+            "name": name,
             "maturity": get_cell(idx_maturity),
             "years_to_maturity": get_cell(idx_years),
             "yield_to_maturity": get_cell(idx_yield),
@@ -164,15 +201,16 @@ def load_cache(path: str = CACHE_FILE) -> Dict | None:
     if not os.path.exists(path):
         return None
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
     except Exception:
         return None
 
 
 def save_cache(data: Dict, path: str = CACHE_FILE) -> None:
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(path, "wb") as f:
+        # Компактный JSON без отступов: файл заметно меньше и быстрее пишется/читается.
+        f.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
 
 
 def print_table(bonds: List[Dict], limit: int | None = None) -> None:
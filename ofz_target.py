@@ -6,7 +6,7 @@
 с минимальным превышением.
 """
 
-from datetime import date, datetime
+from datetime import date
 from ofz_core import fetch_bond, find_min_qty_for_target, fmt_rub
 
 
@@ -19,7 +19,7 @@ def main() -> None:
 
     date_raw = input("Дата покупки YYYY-MM-DD (Enter=сегодня): ").strip()
     purchase_date = (
-        datetime.strptime(date_raw, "%Y-%m-%d").date() if date_raw else date.today()
+        date.fromisoformat(date_raw) if date_raw else date.today()
     )
 
     target_raw = input("Желаемая сумма к погашению, ₽: ").strip().replace(",", ".")